@@ -1,10 +1,8 @@
 from .genTree import GenTree
+from .types import PORTAGE_PLAIN_BOOLS
 
 __all__ = ["GenTree"]
 
-# Some bools don't support y/n, just --bool
-PORTAGE_PLAIN_BOOLS = ["nodeps", "oneshot"]
-
 
 # for cmdline usage
 COMMON_ARGS = [
@@ -26,30 +26,31 @@ class FilterClass(metaclass=MergedFilter):
                 setattr(self, name, kwargs[name])
             else:
                 self.logger.warning("Unknown filter: %s", name)
-
-    @property
-    def filters(self):
-        for f in self.FILTERS:
-            if getattr(self, f, None):
-                yield getattr(self, f"f_{f}")
+        self.filters = self.get_filters()
+
+    def get_filters(self):
+        """Resolves enabled filters once, as (filter function, is name filter) pairs, in FILTERS order"""
+        return tuple((getattr(self, f"f_{f}"), f in self.NAME_FILTERS) for f in self.FILTERS if getattr(self, f, None))
+
+    def get_name(self, target) -> str:
+        """Gets the name of a target, relative to the root, for name filters"""
+        if isinstance(target, str):
+            return target
+        if isinstance(target, TarInfo):
+            return target.name
+        if isinstance(target, Path) and target.is_absolute():
+            return str(target.relative_to("/"))
+        return str(target)
 
     def filter(self, target):
         """Runs all filters on the target in order"""
         orig_target = target
-        for f in self.filters:
-            if f.__name__.removeprefix("f_") in self.NAME_FILTERS:
-                if isinstance(target, str):
-                    val = f(target)
-                elif isinstance(target, TarInfo):
-                    val = f(target.name)
-                elif isinstance(target, Path):
-                    if target.is_absolute():
-                        val = f(str(target.relative_to("/")))
-                    else:
-                        val = f(str(target))
-                else:
-                    val = f(str(target))
-                if not val:
+        name = None
+        for f, name_filter in self.filters:
+            if name_filter:
+                if name is None:  # Get the name once, for all name filters
+                    name = self.get_name(target)
+                if not f(name):
                     target = None
             else:
                 target = f(target)
@@ -60,43 +61,34 @@ class FilterClass(metaclass=MergedFilter):
 
 
 class PathFilters(FilterClass):
-    DOC_DIRS = ["usr/share/doc/", "usr/share/gtk-doc/"]
-    LOCALE_DIRS = ["usr/share/locale/", "usr/share/i18n/locales/", "usr/lib/gconv/", "usr/lib64/gconv/"]
-    FILTERS = ["man", "docs", "include", "locales", "charmaps", "completions", "vardbpkg"]
+    # Filter name: path prefixes, relative to the root
+    PATH_PREFIXES = {
+        "man": ("usr/share/man/",),
+        "docs": ("usr/share/doc/", "usr/share/gtk-doc/"),
+        "include": ("usr/include/",),
+        "locales": ("usr/share/locale/", "usr/share/i18n/locales/", "usr/lib/gconv/", "usr/lib64/gconv/"),
+        "charmaps": ("usr/share/i18n/charmaps/",),
+        "completions": ("usr/share/bash-completion/",),
+        "vardbpkg": ("var/db/pkg/",),
+    }
+    FILTERS = [*PATH_PREFIXES]
     NAME_FILTERS = FILTERS
 
-    def check_path(self, name, path) -> bool:
-        """Checks if a path is in a given directory"""
-        if name.startswith(path):
-            return False
-        if f"{name}/" == path:
-            return False
-        return True
-
-    def f_charmaps(self, name) -> bool:
-        """Filters charmaps"""
-        return self.check_path(name, "usr/share/i18n/charmaps/")
-
-    def f_man(self, name) -> bool:
-        """Filters manual pages"""
-        return self.check_path(name, "usr/share/man/")
-
-    def f_docs(self, name) -> bool:
-        """Filters documentation"""
-        return all(self.check_path(name, d) for d in self.DOC_DIRS)
-
-    def f_include(self, name) -> bool:
-        """Filters include files"""
-        return self.check_path(name, "usr/include/")
-
-    def f_locales(self, name) -> bool:
-        """Filters locales"""
-        return all(self.check_path(name, d) for d in self.LOCALE_DIRS)
-
-    def f_completions(self, name) -> bool:
-        """Filters shell completions"""
-        return self.check_path(name, "usr/share/bash-completion/")
-
-    def f_vardbpkg(self, name) -> bool:
-        """Filters /var/db/pkg"""
-        return self.check_path(name, "var/db/pkg/")
+    def get_filters(self):
+        """Resolves enabled filters, enabled path filters are replaced by a single check against all of their prefixes.
+        Path filters are checked after all other filters."""
+        self.path_prefixes = tuple(
+            prefix for name, prefixes in self.PATH_PREFIXES.items() if getattr(self, name, None) for prefix in prefixes
+        )
+        filters = [
+            (getattr(self, f"f_{f}"), f in self.NAME_FILTERS)
+            for f in self.FILTERS
+            if f not in self.PATH_PREFIXES and getattr(self, f, None)
+        ]
+        if self.path_prefixes:
+            filters.append((self.f_paths, True))
+        return tuple(filters)
+
+    def f_paths(self, name) -> bool:
+        """Filters paths under the prefixes of enabled path filters, and the prefix directories themselves"""
+        return not f"{name}/".startswith(self.path_prefixes)
@@ -1,13 +1,13 @@
 from pathlib import Path
-from tarfile import TarInfo, data_filter
+from tarfile import SYMTYPE, TarInfo, data_filter
 
 from .filters import PathFilters
 
 
 def get_relative_prefix(path):
-    """Takes a path, returns ../ for each path component"""
-    path = Path(path).parent
-    return Path("/".join([".." for _ in path.parts]))
+    """Takes a relative path string, returns ../ for each parent path component"""
+    parents = path.split("/")[:-1]
+    return "../" * (len(parents) - parents.count("") - parents.count("."))
 
 
 def get_whiteout(member):
@@ -40,14 +40,19 @@ class GenTreeTarFilter(PathFilters):
 
     def __call__(self, member, *args, **kwargs):
         member = self.rewrite_absolute_symlinks(member)
-        member = self.filter(member)
-        if member is None:
-            return
+        if self.filters:  # Skip the filter pass when no filters are enabled
+            member = self.filter(member)
+            if member is None:
+                return
 
         if args:
             member = data_filter(member, *args, **kwargs)
         return member
 
+    def get_name(self, member) -> str:
+        """Tar filter targets are always tar members"""
+        return member.name
+
     def f_whiteout(self, member):
         """Detects whiteouts created by the overlay as character devices
         or empty files with the 'trusted.overlay.whiteout' xattr.
@@ -73,11 +78,10 @@ class GenTreeTarFilter(PathFilters):
 
     def rewrite_absolute_symlinks(self, member):
         """Rewrites absolute symlinks to relative symlinks"""
-        if member.issym() and member.linkname.startswith("/"):
-            symlink_target = Path(member.linkname)
-            relative_prefix = get_relative_prefix(member.path)
-            self.logger.debug("Rewriting absolute symlink: %s -> %s" % (member.path, symlink_target))
-            new_target = relative_prefix / symlink_target.relative_to("/")
-            self.logger.debug("Rewrote absolute symlink: %s", new_target)
-            member.linkname = str(new_target)
+        if member.type != SYMTYPE or not member.linkname.startswith("/"):
+            return member
+        self.logger.debug("Rewriting absolute symlink: %s -> %s", member.name, member.linkname)
+        new_target = get_relative_prefix(member.name) + member.linkname.lstrip("/")
+        member.linkname = new_target or "."  # A link to / from the top level
+        self.logger.debug("Rewrote absolute symlink: %s", member.linkname)
         return member
@@ -1,6 +1,9 @@
-from os import chdir, chroot
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from os import CLONE_NEWNS, chdir, chroot, environ, scandir, stat, unshare
 from pathlib import Path
 from shlex import split
+from shutil import rmtree
 from subprocess import CalledProcessError, run
 from tarfile import ReadError, TarFile
 
@@ -8,7 +11,7 @@ from zenlib.logging import loggify
 from zenlib.util import colorize
 
 from .filters import WhiteoutError
-from .gen_tree_config import GenTreeConfig
+from .gen_tree_config import INPUTS_MTIME, GenTreeConfig, as_path
 from .types import MountMixins, OCIMixins
 
 
@@ -38,13 +41,158 @@ def preserve_world(func):
     return wrapper
 
 
+def modified_since(root, mtime_ns):
+    """Checks if the root, or anything under it, was changed after mtime_ns.
+    Uses the ctime, as extracted or copied up files keep their original mtime.
+    Returns at the first changed entry."""
+    if stat(root).st_ctime_ns > mtime_ns:
+        return True
+    dirs = [root]
+    while dirs:
+        with scandir(dirs.pop()) as entries:
+            for entry in entries:
+                if entry.stat(follow_symlinks=False).st_ctime_ns > mtime_ns:
+                    return True
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+    return False
+
+
+def get_base_archives(config):
+    """Yields the layer archives of all bases under the supplied config"""
+    bases = [*config.bases]
+    while bases:
+        base = bases.pop()
+        yield base.layer_archive
+        bases.extend(base.bases)
+
+
+def layer_up_to_date(config):
+    """Checks if the layer archive is newer than everything the layer is built from.
+    Checks the config files of the layer and its parents, the default configs and genTree itself using INPUTS_MTIME,
+    the base layer archives, and everything in the upper root."""
+    try:
+        archive_mtime = config.layer_archive.stat().st_mtime_ns
+    except FileNotFoundError:
+        return False
+    if INPUTS_MTIME > archive_mtime:
+        return False
+    parent = config
+    while parent:  # Parents pass inherited values to the layer
+        if parent.config_mtime and parent.config_mtime > archive_mtime:
+            return False
+        parent = parent.parent
+    for base_archive in get_base_archives(config):
+        try:
+            if base_archive.stat().st_mtime_ns > archive_mtime:
+                return False
+        except FileNotFoundError:
+            return False  # A missing base archive is treated as changed
+    return not modified_since(config.upper_root, archive_mtime)
+
+
+def get_base_levels(config):
+    """Groups all bases under the supplied config by depth, deepest first.
+    Bases are keyed by their layer archive, so a base used by multiple configs is only built once, at its deepest level.
+    """
+    depths, bases = {}, {}
+
+    def walk(config, depth):
+        for base in config.bases:
+            if depths.get(base.layer_archive, 0) < depth:
+                depths[base.layer_archive] = depth
+                bases.setdefault(base.layer_archive, base)
+            walk(base, depth + 1)
+
+    walk(config, 1)
+    levels = {}
+    for archive, depth in depths.items():
+        levels.setdefault(depth, []).append(bases[archive])
+    return [levels[depth] for depth in sorted(levels, reverse=True)]
+
+
+def get_deploy_order(config):
+    """Returns (parent, base) pairs for all bases under the config, in deployment order.
+    Bases are walked depth first, so bases of bases come before the base using them.
+    Each layer archive is only returned once, at its first position."""
+    order, seen = [], set()
+    stack = [(None, config, iter(config.bases))]
+    while stack:
+        parent, current, bases = stack[-1]
+        if (base := next(bases, None)) is not None:
+            stack.append((current, base, iter(base.bases)))
+            continue
+        stack.pop()
+        if parent is None or current.layer_archive in seen:
+            continue
+        seen.add(current.layer_archive)
+        order.append((parent, current))
+    return order
+
+
+def get_profile_groups(bases):
+    """Splits bases into groups which can be built at the same time.
+    Bases without a config overlay set the portage profile through a symlink shared by the whole seed,
+    so a group only contains bases which use the same profile through each shared symlink.
+
+    Returns (shared profile links, bases) for each group, the links map each shared symlink to a base using it."""
+    groups = []
+    for base in bases:
+        profile_sym = None
+        if (profile_link := base.profile_link) and not profile_link[0].is_relative_to(base.overlay_root):
+            profile_sym = profile_link[0]
+        for links, group in groups:
+            if profile_sym is None or links.setdefault(profile_sym, base).profile_link == profile_link:
+                group.append(base)
+                break
+        else:
+            groups.append(({profile_sym: base} if profile_sym else {}, [base]))
+    return groups
+
+
+BASE_WORKER = {}  # GenTree and bases for the current base build worker, inherited through fork
+BASE_TMPDIR = Path("/var/tmp/genTree")  # Parent of the per base PORTAGE_TMPDIR used by workers
+
+
+def init_base_worker(genTree, bases):
+    """Initializes a base build worker.
+    Uses a private mount namespace so config overlay mounts don't collide with other workers.
+    Errors are raised by build_base, as an initializer error breaks the pool without a useful message."""
+    BASE_WORKER["genTree"], BASE_WORKER["bases"] = genTree, bases
+    try:
+        unshare(CLONE_NEWNS)
+        run(["mount", "--make-rprivate", "/"], check=True, capture_output=True)
+    except (OSError, CalledProcessError) as e:
+        stderr = e.stderr.decode().strip() if isinstance(e, CalledProcessError) else e
+        BASE_WORKER["error"] = f"Failed to create a private mount namespace for parallel base builds: {stderr}"
+
+
+def build_base(index):
+    """Builds the base layer at the index of the worker bases, using a portage tmpdir unique to the base.
+    The tmpdir is removed once the base is built."""
+    if error := BASE_WORKER.get("error"):
+        raise RuntimeError(f"{error}\nSet parallel_bases to 1 to build bases serially.")
+    genTree, base = BASE_WORKER["genTree"], BASE_WORKER["bases"][index]
+    tmpdir = BASE_TMPDIR / base.buildname
+    tmpdir.mkdir(parents=True, exist_ok=True)
+    environ["PORTAGE_TMPDIR"] = str(tmpdir)
+    try:
+        genTree.build_layer(config=base)
+    finally:
+        rmtree(tmpdir, ignore_errors=True)
+
+
 @loggify
 class GenTree(MountMixins, OCIMixins):
     def __init__(self, config_file=None, *args, **kwargs):
         self.config = GenTreeConfig(config_file=config_file, logger=self.logger, **kwargs)
 
     def build_bases(self, config):
-        """Builds the bases for the current config"""
+        """Builds the bases for the current config.
+        If parallel_bases is greater than 1, bases are built in parallel, see build_bases_parallel."""
+        if config.parallel_bases > 1:
+            return self.build_bases_parallel(config=config)
+
         if bases := config.bases:
             for base in bases:
                 base.logger.info(
@@ -54,16 +202,39 @@ class GenTree(MountMixins, OCIMixins):
                 )
                 self.build(config=base)
 
-    @preserve_world
-    def deploy_base(self, config, base, dest, deployed_bases=None, pretend=False):
-        """Deploys bases over the config lower root. Recursively deploys bases of the base."""
-        deployed_bases = [] if deployed_bases is None else deployed_bases
-        if base.layer_archive in deployed_bases:
-            return base.logger.debug("Skipping base as it has already been deployed: %s", base.layer_archive)
-
-        if not Path(dest).exists():
+    def build_bases_parallel(self, config):
+        """Builds all bases under the current config using a process pool, one depth level at a time.
+        Bases at the same depth don't depend on each other, deeper bases are built first.
+        Bases which need different profiles through the same shared profile symlink are built in separate pools,
+        the shared symlinks are set before the workers start, see get_profile_groups.
+        The GenTree and bases are inherited by the workers through fork, so only indexes are passed."""
+        for level in get_base_levels(config):
+            for profile_links, bases in get_profile_groups(level):
+                for base in profile_links.values():
+                    base.set_portage_profile()
+                self.build_base_group(config=config, bases=bases)
+
+    def build_base_group(self, config, bases):
+        """Builds bases which can be built at the same time using a process pool"""
+        config.logger.info(
+            " +.+ [%s] Building bases in parallel: %s",
+            colorize(config.file_display_name, "cyan"),
+            colorize(", ".join(base.name for base in bases), "blue", bold=True),
+        )
+        with ProcessPoolExecutor(
+            max_workers=min(config.parallel_bases, len(bases)),
+            mp_context=get_context("fork"),
+            initializer=init_base_worker,
+            initargs=(self, bases),
+        ) as executor:
+            list(executor.map(build_base, range(len(bases))))  # Consume the results to raise worker exceptions
+
+    def deploy_base(self, config, base, dest):
+        """Deploys a base over the dest dir, using the whiteout filter of the config which uses the base."""
+        dest = as_path(dest)
+        if not dest.exists():
             base.logger.debug("Creating parent directories for: %s", dest)
-            Path(dest).mkdir(parents=True)
+            dest.mkdir(parents=True)
 
         try:
             with TarFile.open(base.layer_archive, "r") as tar:
@@ -76,20 +247,22 @@ class GenTree(MountMixins, OCIMixins):
         self.apply_opaques(dest, config.opaques)
         self.apply_whiteouts(dest, config.whiteouts)
 
-    def deploy_bases(self, config, dest=None, deployed_bases=None, pretend=False):
+    @preserve_world
+    def deploy_bases(self, config, dest=None, pretend=False):
         """Deploys the bases to the lower dir for the current config.
-        Mounts an overlayfs on the build root."""
+        Bases of bases are deployed before the base using them, each layer archive is only deployed once.
+        If pretend is set, nothing is extracted.
+
+        Returns the deployed layer archives, in order."""
         dest = dest or config.lower_root
-        bases = getattr(config, "bases")
-        if not bases:  # Make sure the lower root is created since there are no bases to deploy
+        if not config.bases:  # Make sure the lower root is created since there are no bases to deploy
             config.check_dir("lower_root")
             return []
 
-        deployed_bases = [] if deployed_bases is None else deployed_bases
-        for base in bases:
-            self.logger.debug("[%s] Handling base: %s", config.name, base.name)
-            self.deploy_bases(config=base, dest=dest, deployed_bases=deployed_bases, pretend=pretend)
-            self.deploy_base(config=config, base=base, dest=dest, deployed_bases=deployed_bases, pretend=pretend)
+        deployed_bases = []
+        for parent, base in get_deploy_order(config):
+            if not pretend:
+                self.deploy_base(config=parent, base=base, dest=dest)
             deployed_bases.append(base.layer_archive)
         return deployed_bases
 
@@ -133,7 +306,7 @@ class GenTree(MountMixins, OCIMixins):
         self.run_emerge(config.emerge_flags, config=config)
 
         if config.depclean:
-            self.run_emerge(["--root", config.overlay_root, "--depclean", "--with-bdeps=n"], config=config)
+            self.run_emerge([*config.emerge_root_flags, "--depclean", "--with-bdeps=n"], config=config)
 
     def perform_unmerge(self, config):
         """unmerges the packages in the unmerge list"""
@@ -144,14 +317,17 @@ class GenTree(MountMixins, OCIMixins):
         config.logger.info(
             " [U] [%s] Unmerging packages: %s", colorize(config.name, "blue"), colorize(", ".join(packages), "red")
         )
-        self.run_emerge(["--root", config.overlay_root, "--unmerge", *packages], config=config)
+        self.run_emerge([*config.emerge_root_flags, "--unmerge", *packages], config=config)
 
     def build(self, config):
-        """Builds all bases and branches under the current config
-        Builds/installs packages in the config build root
+        """Builds all bases and branches under the current config, then builds the config layer"""
+        self.build_bases(config=config)
+        self.build_layer(config=config)
+
+    def build_layer(self, config):
+        """Builds/installs packages in the config build root
         Unmerges packages in the config unmerge list
         Packs the build tree into config.layer_archive."""
-        self.build_bases(config=config)
         if config.layer_archive.exists() and not config.rebuild:
             return config.logger.warning(
                 " ... [%s] Skipping build, layer archive exists: %s",
@@ -169,7 +345,15 @@ class GenTree(MountMixins, OCIMixins):
 
     def pack(self, config):
         """Packs the upper dir of the layer into config.layer_archive.
-        The file is named config.buildname which is {config.name}-{config.buildname}"""
+        The file is named config.buildname which is {config.name}-{config.buildname}
+        If skip_unchanged_pack is set, the layer is only packed if something it is built from changed."""
+        if config.skip_unchanged_pack and layer_up_to_date(config):
+            return config.logger.info(
+                " ... [%s] Skipping pack, layer archive is up to date: %s",
+                colorize(config.name, "blue"),
+                colorize(config.layer_archive, "cyan"),
+            )
+
         config.logger.info(
             " >:- [%s] Packing tree: %s",
             colorize(config.name, "blue", bold=True),
@@ -179,7 +363,7 @@ class GenTree(MountMixins, OCIMixins):
         with TarFile.open(config.layer_archive, "w") as tar:
             for file in config.upper_root.rglob("*"):
                 archive_path = file.relative_to(config.upper_root)
-                config.logger.log(5, f"[{config.upper_root}] Adding file: {archive_path}")
+                config.logger.log(5, "[%s] Adding file: %s", config.upper_root, archive_path)
                 try:
                     tar.add(
                         file,
@@ -230,7 +414,7 @@ class GenTree(MountMixins, OCIMixins):
                             self.logger.debug("[%s] Skipping existing directory: %s", config.name, file.name)
                             continue
                         if f := tar_filter(file):
-                            self.logger.log(5, f"[{base}] Adding file: {f.name}")
+                            self.logger.log(5, "[%s] Adding file: %s", base, f.name)
                             re_add(tar, f, base_tar)
                         else:  # Skip filtered files
                             self.logger.log(5, "[%s] Skipping file: %s", config.name, file.name)
@@ -341,8 +525,9 @@ class GenTree(MountMixins, OCIMixins):
             if config.bases:
                 for base in config.bases:
                     emerge_bases(base)
-            config.crossdev_target = chain  # Force using crossdev
             config.emerge_bools["oneshot"] = True
+            config.crossdev_target = chain  # Force using crossdev
+            config.clear_cached_properties()  # emerge_bools was changed in place, so the field setter doesn't see it
             if not config.packages:
                 return  # Don't do anyhting if packaegs aren't defined
             self.run_emerge(config.emerge_flags[2:], config=config)
@@ -1,63 +1,165 @@
-from copy import deepcopy
 from dataclasses import field
+from functools import cache, cached_property
+from itertools import chain
+from operator import attrgetter
 from os import environ
+from os.path import normpath
 from pathlib import Path
 from subprocess import SubprocessError, run
-from tomllib import load
+from threading import Lock
+from types import MappingProxyType
 from typing import Optional, Union
 
 from zenlib.types import validatedDataclass
 from zenlib.util import colorize, handle_plural, pretty_print
 
 from .filters import BuildCleaner, GenTreeTarFilter, WhiteoutFilter
-from .types import EmergeBools, PortageFlags
+from .types import EmergeBools, PortageFlags, flag_tokens
+
+try:  # rtoml is an optional, faster, native TOML parser
+    from rtoml import loads
+except ImportError:
+    from tomllib import loads
+
+EMPTY = MappingProxyType({})  # Shared read-only fallback for dict lookups
+BUILDS_ROOT = Path("/builds")  # Where build_dir is mounted in the sysroot
+CONFIG_ROOT = Path("/config")  # Where config_dir is mounted in the sysroot
+MODULE_DIR = Path(__file__).parent
+MODULE_CONFIG_DIR = MODULE_DIR / "config"  # Included configs, which can be used by name
 
 # Lookup the crossdev profile using the crossdev_target
 DEFAULT_EXPAND = {"crossdev_profile": "crossdev_target"}
 
+
+def as_path(value):
+    """Returns the value as a Path, without rebuilding values which are already paths"""
+    return value if isinstance(value, Path) else Path(value)
+
+
+def fast_copy(value):
+    """Copies parsed TOML data, recursing into dicts and lists.
+    All other TOML values are immutable and returned as is, avoiding the overhead of deepcopy."""
+    value_type = type(value)
+    if value_type is dict:
+        return {key: fast_copy(val) for key, val in value.items()}
+    if value_type is list:
+        return [fast_copy(val) for val in value]
+    return value
+
+
+TOML_CACHE = {}  # Parsed config files, keyed by resolved path, mtime and size
+TOML_CACHE_LOCK = Lock()
+
+
+def toml_key(config_file):
+    """Returns the TOML_CACHE key of a toml file, its resolved path, mtime and size"""
+    config_file = as_path(config_file).resolve()
+    config_stat = config_file.stat()
+    return str(config_file), config_stat.st_mtime_ns, config_stat.st_size
+
+
+def load_toml(config_file, key=None):
+    """Loads a toml file, caching the parsed config by resolved path, mtime and size.
+    If the key was already read using toml_key, it can be passed so the file is not stat'd again.
+    Returns a copy of the parsed config, so the cached config is never modified, and the cache key."""
+    key = key or toml_key(config_file)
+    with TOML_CACHE_LOCK:
+        if key not in TOML_CACHE:
+            TOML_CACHE[key] = loads(Path(key[0]).read_bytes().decode())  # Parse from memory, in one read
+        return fast_copy(TOML_CACHE[key]), key
+
+
+def merge_tables(table, other):
+    """Merges other into table, nested tables are merged recursively, other values are replaced"""
+    for key, value in other.items():
+        if isinstance(value, dict) and isinstance(current := table.get(key), dict):
+            merge_tables(current, value)
+        else:
+            table[key] = value
+
+
 # Check load config from the package root/default.toml,
 # Then check /etc/genTree/gentree.toml and ~/.config/genTree/gentree.toml
-
-DEFAULT_CONFIG = {}
-for config in [
-    Path(__file__).parent / "default.toml",
+DEFAULT_CONFIG_FILES = (
+    MODULE_DIR / "default.toml",
     Path("/etc/genTree/config.toml"),
     Path("~/.config/genTree/config.toml").expanduser(),
-]:  # For "default configs", later-parsed attributes overwrite previous ones
-    # User supplied config is merged over the final DEFAULT_CONFIG
-    if config.exists():
-        with open(config, "rb") as f:
-            config = load(f)
-            for key, value in config.items():
-                if key in DEFAULT_CONFIG and isinstance(value, dict):
-                    DEFAULT_CONFIG[key] |= value
-                elif key in DEFAULT_CONFIG and isinstance(value, list):
-                    DEFAULT_CONFIG[key].extend(value)
-                else:
-                    DEFAULT_CONFIG[key] = value
+)
+
+
+def load_default_config(config_files=DEFAULT_CONFIG_FILES):
+    """Loads and merges the default config files, skipping missing files.
+    For "default configs", later-parsed attributes overwrite previous ones.
+    User supplied config is merged over the final DEFAULT_CONFIG
+    Returns the merged config and the newest mtime of the loaded files."""
+    default_config, newest_mtime = {}, 0
+    for config_file in config_files:
+        try:
+            config, (_, config_mtime, _) = load_toml(config_file)
+        except FileNotFoundError:
+            continue
+        newest_mtime = max(newest_mtime, config_mtime)
+        for key, value in config.items():
+            current = default_config.get(key)  # Looked up once, merged in place
+            if isinstance(value, dict) and isinstance(current, dict):
+                merge_tables(current, value)
+            elif isinstance(value, list) and isinstance(current, list):
+                current.extend(value)
+            else:
+                default_config[key] = value
+    return default_config, newest_mtime
+
+
+def get_module_mtime():
+    """Returns the newest mtime of the genTree sources and included configs"""
+    module_files = chain(MODULE_DIR.rglob("*.py"), MODULE_DIR.rglob("*.toml"))
+    return max(module_file.stat().st_mtime_ns for module_file in module_files)
 
 
+DEFAULT_CONFIG, DEFAULT_CONFIG_MTIME = load_default_config()
+# Recorded at import, layers are packed in a chroot where the host default configs and genTree are not available
+INPUTS_MTIME = max(DEFAULT_CONFIG_MTIME, get_module_mtime())
+
+# Seed and build tag overrides from default.seed.build_tag.attr and default.seed.attr,
+# flattened so get_default can use single lookups, keyed by (seed, build_tag, attr).
+# Seed overrides use None as the build tag.
+DEFAULT_OVERRIDES = {}
+for seed, seed_overrides in DEFAULT_CONFIG.get("default", {}).items():
+    for key, value in seed_overrides.items():
+        DEFAULT_OVERRIDES[(seed, None, key)] = value
+        if isinstance(value, dict):  # Tables under a seed may be build tag overrides
+            for attr, build_value in value.items():
+                DEFAULT_OVERRIDES[(seed, key, attr)] = build_value
+
+# A list, handle_plural expands lists
 DEF_ARGS = ["clean_filter_options", "tar_filter_options", "emerge_args", "emerge_bools"]
-CPU_FLAG_VARS = [f"cpu_flags_{arch}" for arch in ["x86", "arm", "ppc"]]
-COMMON_FLAGS = ["cflags", "cxxflags", "fcflags", "fflags"]  # The variable common flags should append to
-ENV_VAR_INHERITED = [*COMMON_FLAGS, *CPU_FLAG_VARS, "binpkg_format"]
-BASIC_ENV_VARS = ["accept_keywords", "accept_license"]
-ENV_VARS = [*ENV_VAR_INHERITED, *BASIC_ENV_VARS, "use", "features"]
-
-NO_DEFAULT_LOOKUP = [
-    "name",  # Should be unique to each config
-    "config_file",  # ''
-    "build_tag",  # Used as a config lookup/identifier, cannot be set as a default
-    "parent",  # Only inherited
-    "bases",  # No sense in this being a default
-    "whiteouts",  # Handled by filters
-    "opaques",  # ''
-    "packages",  # Should be unique per tree, no sense in a default
-    "unmerge",  # ''
-    "logger",
-]
-
-INHERITED_CONFIG = [
+CPU_FLAG_VARS = tuple(f"cpu_flags_{arch}" for arch in ("x86", "arm", "ppc"))
+COMMON_FLAGS = ("cflags", "cxxflags", "fcflags", "fflags")  # The variable common flags should append to
+ENV_VAR_INHERITED = (*COMMON_FLAGS, *CPU_FLAG_VARS, "binpkg_format")
+BASIC_ENV_VARS = ("accept_keywords", "accept_license")
+ENV_VARS = (*ENV_VAR_INHERITED, *BASIC_ENV_VARS, "use", "features")
+# Env vars which are not taken from the standard env for crossdev targets, unless crossdev_use_env is set
+CROSSDEV_ENV_VARS = frozenset([*ENV_VAR_INHERITED, "common_flags"])
+# Config keys which are processed separately, rather than set directly as attributes in load_config
+LOAD_CONFIG_SKIPPED = frozenset(["name", "logger", "env", "crossdev_env", "bases", "whiteouts", "opaques", *DEF_ARGS])
+
+NO_DEFAULT_LOOKUP = frozenset(
+    {
+        "name",  # Should be unique to each config
+        "config_file",  # ''
+        "build_tag",  # Used as a config lookup/identifier, cannot be set as a default
+        "parent",  # Only inherited
+        "bases",  # No sense in this being a default
+        "whiteouts",  # Handled by filters
+        "opaques",  # ''
+        "packages",  # Should be unique per tree, no sense in a default
+        "unmerge",  # ''
+        "logger",
+    }
+)
+DEFAULT_MISSES = set()  # (seed, build_tag, attr) of attributes with no default value
+
+INHERITED_CONFIG = (
     "seed",  # Must be set in the top level config, cannot be set in a child
     "crossdev_target",  # ''
     "build_tag",  # ''
@@ -65,41 +167,72 @@ INHERITED_CONFIG = [
     "clean_build",  # Makes sense to inherit, but overrides can be set in a child
     "crossdev_use_env",  # ''
     "rebuild",  # ''
+    "skip_unchanged_pack",  # ''
     "profile",  # ''
     "profile_repo",  # ''
-]
-
-CHILD_RESTRICTED = [
-    "seed",
-    "crossdev_target",
-    "seed_dir",
-    "_seed_dir",
-    "build_dir",
-    "_build_dir",
-    "pkgdir",
-    "_pkgdir",
-    "config_dir",
-    "_config_dir",
-    "distfile_dir",
-    "_distfile_dir",
-    "repo_dir",
-    "_repo_dir",
-    "conf_root",
-    "output_file",
-    "refilter",
-    "_buildname",
-    "build_tag",
-    "package_tag",
-]
+)
+INHERITED_GETTER = attrgetter(*INHERITED_CONFIG)
+
+CHILD_RESTRICTED = frozenset(
+    [
+        "seed",
+        "crossdev_target",
+        "seed_dir",
+        "_seed_dir",
+        "build_dir",
+        "_build_dir",
+        "pkgdir",
+        "_pkgdir",
+        "config_dir",
+        "_config_dir",
+        "distfile_dir",
+        "_distfile_dir",
+        "repo_dir",
+        "_repo_dir",
+        "conf_root",
+        "output_file",
+        "refilter",
+        "_buildname",
+        "build_tag",
+        "package_tag",
+    ]
+)
+
+
+@cache
+def get_emerge_profiles(crossdev_target=None):
+    """Gets the available portage profiles for the system, or the crossdev target root.
+    Cached per target, as listing profiles runs eselect."""
+    cfgroot = f"/usr/{crossdev_target}" if crossdev_target else "/"
+    try:  # Set the config root only for eselect, leaving the environment unchanged
+        profiles = run(
+            ["eselect", "profile", "list"],
+            check=True,
+            capture_output=True,
+            env={**environ, "PORTAGE_CONFIGROOT": cfgroot},
+        )
+    except SubprocessError as e:
+        raise ValueError(f"Failed to get profiles: {e}")
+    return profiles.stdout.decode()
 
 
+def freeze(value):
+    """Returns a hashable representation of a config value"""
+    if isinstance(value, dict):
+        return frozenset((key, freeze(val)) for key, val in value.items())
+    if isinstance(value, set):
+        return frozenset(value)
+    if isinstance(value, list):
+        return tuple(freeze(val) for val in value)
+    return value
+
+
+@cache
 def find_config(config_file):
-    """Finds a config file included in the config module"""
-    module_dir = Path(__file__).parent / "config"
-    config = module_dir / Path(config_file).with_suffix(".toml")
-    if not config.exists():
-        raise FileNotFoundError(f"Config file not found: {config}")
-    return config
+    """Finds a config file included in the config module.
+    Cached, bases are looked up by name once per layer which includes them.
+    Missing files are not checked here, load_config raises FileNotFoundError when opening them."""
+    return MODULE_CONFIG_DIR / Path(config_file).with_suffix(".toml")
 
 
 @validatedDataclass
@@ -137,6 +270,8 @@ class GenTreeConfig:
     env: dict = None  # Environment variables to set in the chroot
     # portage args
     rebuild: bool = False  # Rebuilds the layer from scratch
+    skip_unchanged_pack: bool = False  # Don't repack rebuilt layers if nothing they are built from changed
+    parallel_bases: int = 1  # Number of bases to build in parallel, bases are built serially by default
     depclean: bool = False  # runs emerge --depclean --with-bdeps=n after pulling packages
     packages: list = None  # List of packages to install on the layer
     unmerge: list = None  # List of packages to unmerge on the layer
@@ -162,10 +297,14 @@ class GenTreeConfig:
     whiteouts: set = None  # List of paths to "whiteout" in the lower layer
     opaques: set = None  # List of paths to "opaque" in the lower layer
 
+    @cached_property
+    def resolved_conf_root(self):
+        return as_path(self.conf_root).expanduser().resolve()
+
     def on_conf_root(self, path):
-        return Path(self.conf_root).expanduser().resolve() / path
+        return self.resolved_conf_root / path
 
-    @property
+    @cached_property
     def pkgdir(self):
         if self._pkgdir:
             return self._pkgdir.expanduser().resolve()
@@ -178,48 +317,48 @@ class GenTreeConfig:
             pkgdir += f"_{self.crossdev_target}"
         return self.on_conf_root(pkgdir)
 
-    @property
+    @cached_property
     def pkgdir_mount(self):
         if self.crossdev_target:
             return self.sysroot / f"usr/{self.crossdev_target}/var/cache/binpkgs"
         return self.sysroot / "var/cache/binpkgs"
 
-    @property
+    @cached_property
     def build_dir(self):
         if self._build_dir:
             return self._build_dir.expanduser().resolve()
         else:
             return self.on_conf_root("builds")
 
-    @property
+    @cached_property
     def seed_dir(self):
         if self._seed_dir:
             return self._seed_dir.expanduser().resolve()
         else:
             return self.on_conf_root("seeds")
 
-    @property
+    @cached_property
     def config_dir(self):
         if self._config_dir:
             return self._config_dir.expanduser().resolve()
         else:
             return self.on_conf_root("config")
 
-    @property
+    @cached_property
     def distfile_dir(self):
         if self._distfile_dir:
             return self._distfile_dir.expanduser().resolve()
         else:
             return self.on_conf_root("distfiles")
 
-    @property
+    @cached_property
     def repo_dir(self):
         if self._repo_dir:
             return self._repo_dir.expanduser().resolve()
         else:
             return self.on_conf_root("repos")
 
-    @property
+    @cached_property
     def buildname(self):
         if self._buildname:
             return self._buildname
@@ -231,91 +370,97 @@ class GenTreeConfig:
         buildname += f"-{self.name}"
         return buildname
 
-    @property
+    @cached_property
     def overlay_root(self):
-        return Path("/builds") / self.buildname
+        return BUILDS_ROOT / self.buildname
 
-    @property
+    @cached_property
     def portage_config_overlay(self):
         return self.overlay_root / "etc/portage"
 
-    @property
+    @cached_property
     def portage_config_dir(self):
         if self.config_overlay:
-            return Path("/config") / self.config_overlay
+            return CONFIG_ROOT / self.config_overlay
 
-    @property
+    @cached_property
     def lower_root(self):
         return self.overlay_root.with_name(f".{self.buildname}_lower")
 
-    @property
+    @cached_property
     def upper_root(self):
         return self.overlay_root.with_name(f"{self.buildname}_upper")
 
-    @property
+    @cached_property
     def config_mount(self):
         return self.sysroot / "config"
 
-    @property
+    @cached_property
     def build_mount(self):
         return self.sysroot / "builds"
 
-    @property
+    @cached_property
     def sysroot(self):
         if self.no_seed_overlay:
             return self.seed_dir / self.seed
         return self.seed_dir / f"{self.seed}_sysroot"
 
-    @property
+    @cached_property
     def seed_root(self):
         return self.sysroot.with_name(f"{self.seed}")
 
-    @property
+    @cached_property
     def layer_archive(self):
         return self.overlay_root.with_suffix(self.archive_extension)
 
-    @property
+    @cached_property
     def output_archive(self):
         if self.output_file:
-            return Path("/builds") / self.output_file
+            return BUILDS_ROOT / self.output_file
         return self.overlay_root.with_stem(f"{self.buildname}-full").with_suffix(self.archive_extension)
 
-    @property
+    @cached_property
     def tar_filter(self):
         return GenTreeTarFilter(logger=self.logger, **self.tar_filter_options)
 
-    @property
+    @cached_property
     def whiteout_filter(self):
         return WhiteoutFilter(logger=self.logger, whiteouts=self.whiteouts, opaques=self.opaques)
 
-    @property
+    @cached_property
     def cleaner(self):
         return BuildCleaner(logger=self.logger, **self.clean_filter_options)
 
-    @property
+    @cached_property
     def file_display_name(self):
         if not self.config_file:
             if self.crossdev_target:
                 return self.crossdev_target
             return self.seed
-        elif self.config_file.is_relative_to(Path(__file__).parent):
+        elif self.config_file.is_relative_to(MODULE_DIR):
             return self.config_file.name
         return self.config_file
 
-    @property
+    @cached_property
     def emerge_string_args(self):
-        return [f"--{k}={v}" for k, v in self.emerge_args.items()]
+        return tuple(f"--{k}={v}" for k, v in self.emerge_args.items())
 
-    @property
+    @cached_property
     def emerge_bool_args(self):
-        return str(self.emerge_bools).split()
+        return tuple(self.emerge_bools.as_list())
 
-    @property
+    @cached_property
+    def emerge_root_flags(self):
+        """The --root emerge args for the overlay root, stringified once"""
+        return ("--root", str(self.overlay_root))
+
+    @cached_property
     def emerge_flags(self):
-        flags = ["--root", str(self.overlay_root)]
+        """The full emerge argv, built once. A tuple, so the cached value can't be changed by callers"""
+        flags = self.emerge_root_flags
         if self.config_overlay:
-            flags.extend(["--config-root", str(self.overlay_root)])
-        return [*flags, *self.emerge_string_args, *self.emerge_bool_args, *self.packages]
+            flags = (*flags, "--config-root", flags[1])
+        return (*flags, *self.emerge_string_args, *self.emerge_bool_args, *self.packages)
 
     @property
     def emerge_cmd(self):
@@ -323,16 +468,7 @@ class GenTreeConfig:
 
     @property
     def emerge_profiles(self):
-        cfgroot = f"/usr/{self.crossdev_target}" if self.crossdev_target else "/"
-        old_root = environ.get("PORTAGE_CONFIGROOT")
-        environ["PORTAGE_CONFIGROOT"] = cfgroot
-        try:
-            profles = run(["eselect", "profile", "list"], check=True, capture_output=True)
-        except SubprocessError as e:
-            raise ValueError(f"Failed to get profiles: {e}")
-        if old_root:
-            environ["PORTAGE_CONFIGROOT"] = old_root
-        return profles.stdout.decode()
+        return get_emerge_profiles(self.crossdev_target)
 
     def get_default(self, attr, *subattrs, default=None):
         """Gets defaults set in the DEFAULT_CONFIG.
@@ -345,12 +481,10 @@ class GenTreeConfig:
         """
         if attr in NO_DEFAULT_LOOKUP:
             return self.logger.log(5, "No default lookup for attribute: %s", attr)
-        val = None
-        if seed_overrides := DEFAULT_CONFIG.get("default", {}).get(self.seed):
-            if build_overrides := seed_overrides.get(self.build_tag):
-                val = build_overrides.get(attr)  # Get the build tag override if it exists
-            if val is None:  # Try to get the seed override if no build tag override is set
-                val = seed_overrides.get(attr)  # Get the seed override if it exists
+        seed, build_tag = self.seed, self.build_tag
+        val = DEFAULT_OVERRIDES.get((seed, build_tag, attr)) if build_tag is not None else None
+        if val is None:  # Try to get the seed override if no build tag override is set
+            val = DEFAULT_OVERRIDES.get((seed, None, attr))
         val = val or DEFAULT_CONFIG.get(attr)  # Get the default value if no seed override is set
 
         if attr in DEFAULT_EXPAND:
@@ -359,48 +493,69 @@ class GenTreeConfig:
                 val = val.get(search_val)
             else:
                 return self.logger.debug(
-                    "[%s] Cannot expand default value, search value is not set: %s" % (attr, DEFAULT_EXPAND[attr])
+                    "[%s] Cannot expand default value, search value is not set: %s", attr, DEFAULT_EXPAND[attr]
                 )
 
         if val and subattrs:
             for subattr in subattrs:
-                val = val.get(subattr, {})
+                val = val.get(subattr, EMPTY)
         val = val or default
         if val is None:
             return self.logger.debug("[%s] No default value found", attr)
         if type(val).__name__ not in ["str", "int", "bool"]:
-            val = deepcopy(val)
+            val = fast_copy(val)
         self.logger.debug("[%s] Using default value: %s", attr, val)
         return val
 
     def __getattribute__(self, attr):
-        """Ge"""
-        if attr.startswith("_") or attr in NO_DEFAULT_LOOKUP:
-            return super().__getattribute__(attr)
-
+        """Gets an attribute, unset (None) config values are loaded from the defaults on first access"""
         val = super().__getattribute__(attr)
-        if val is None:
-            if attr == "seed":
-                return DEFAULT_CONFIG.get("seed")  # Seed is used in a lookup in get_default
-            self.logger.log(5, "Getting default value for %s", attr)
-            default = self.get_default(attr)
-            if default is not None:
-                # If the default is set, deepcopy it and set it as the attribute
-                super().__setattr__(attr, deepcopy(default))
-                val = super().__getattribute__(attr)
-            else:
-                self.logger.log(5, "No default value found for %s", attr)
-                NO_DEFAULT_LOOKUP.append(attr)
+        if val is not None or attr not in DEFAULT_LOOKUP_FIELDS:
+            return val
+
+        if attr == "seed":
+            return DEFAULT_CONFIG.get("seed")  # Seed is used in a lookup in get_default
+        if (miss_key := (self.seed, self.build_tag, attr)) in DEFAULT_MISSES:
+            return None
+        self.logger.log(5, "Getting default value for %s", attr)
+        val = self.get_default(attr)  # Non-scalar defaults are already copied by get_default
+        if val is not None:
+            super().__setattr__(attr, val)
+        else:
+            self.logger.log(5, "No default value found for %s", attr)
+            if attr not in DEFAULT_EXPAND:  # Expanded defaults also depend on the search value
+                DEFAULT_MISSES.add(miss_key)
         return val
 
-    @handle_plural
     def add_base(self, base: Union[str, Path]):
-        """Adds a base is a config which is used as an image base for the current config"""
+        """Adds a base is a config which is used as an image base for the current config.
+        Bases are shared between configs under the same top level config which pass them the same inherited values.
+        Shared bases keep the logger and parent of the first config which loaded them."""
         if not str(base).endswith(".toml"):
             base = find_config(base)
-        self.bases.append(GenTreeConfig(logger=self.logger, config_file=base, parent=self))
+        try:
+            config_key = toml_key(base)
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"Config file does not exist: {base}") from e
+        key = (config_key, INHERITED_GETTER(self), self.config_overlay, freeze(self.env))
+        if base_config := self.loaded_bases.get(key):
+            self.logger.debug("Using already loaded base: %s", base_config.name)
+        else:  # Load the config here, so the file is only stat'd once
+            config, _ = load_toml(base, config_key)
+            base_config = GenTreeConfig(logger=self.logger, config_file=base, config=config, parent=self)
+            base_config.config_mtime = config_key[1]
+            self.loaded_bases[key] = base_config
+        self.bases.append(base_config)
+
+    def add_bases(self, bases: list[Union[str, Path]]):
+        """Adds multiple bases using add_base"""
+        for base in bases:
+            self.add_base(base)
 
     def __post_init__(self, *args, **kwargs):
+        self.config_mtime = None  # mtime of the config file when it was loaded, in ns
+        # Bases loaded under the top level config, shared by all children, see add_base
+        self.loaded_bases = self.parent.loaded_bases if self.parent else {}
         self.process_kwargs(kwargs)
         config_file = self.config_file or kwargs.get("config_file")
         if config_file:
@@ -411,15 +566,16 @@ class GenTreeConfig:
             self.load_standard_config()
             bases = self.bases
             self.bases = []
-            self.add_base(bases)
+            self.add_bases(bases)
 
     def inherit_parent(self):
         """Inherits config from the parent object"""
         self.logger.log(5, "Inheriting config from parent: %s", self.parent)
-        for attr in INHERITED_CONFIG:
-            if parent_val := getattr(self.parent, attr, self.get_default(attr)):
-                self.logger.debug("Inheriting attribute: %s=%s", attr, parent_val)
-                setattr(self, attr, parent_val)
+        # Parent values were validated when set, so they are written directly
+        inherited = {attr: val for attr, val in zip(INHERITED_CONFIG, INHERITED_GETTER(self.parent)) if val}
+        self.logger.debug("Inheriting attributes: %s", inherited)
+        self.__dict__.update(inherited)
+        self.clear_cached_properties()
         if self.inherit_config:
             if "config_overlay" in self.config:
                 raise ValueError(
@@ -429,9 +585,10 @@ class GenTreeConfig:
 
     def process_kwargs(self, kwargs):
         """Process kwargs to set config values"""
+        if kwargs:
+            self.logger.debug("Setting attributes from kwargs: %s", kwargs)
         for key, value in kwargs.items():
-            self.logger.debug("Setting attribute from kwargs: %s=%s", key, value)
-            setattr(self, key, value)
+            setattr(self, key, value)  # setattr, so values are validated
 
     def load_standard_config(self):
         self.load_defaults(DEF_ARGS)  # load defaults
@@ -441,30 +598,27 @@ class GenTreeConfig:
     def load_defaults(self, argname):
         """Loads default values from the config file
         Uses this value if no value is set in the config"""
-        if default := self.get_default(argname):
-            default = deepcopy(default)
-        else:
-            default = {}
+        default = self.get_default(argname) or {}  # get_default returns a copy
         self.logger.log(5, "[%s] Loaded default config: %s", argname, default)
-        setattr(self, argname, default | self.config.get(argname, {}))
+        setattr(self, argname, default | self.config.get(argname, EMPTY))
 
     def load_config(self, config_file):
         """Read the config file, load it into self.config, set all config values as attributes"""
-        config = Path(config_file)
-        if not config.exists():
-            raise FileNotFoundError(f"Config file does not exist: {config_file}")
-
-        with open(config, "rb") as f:
-            self.config = load(f)
+        config = as_path(config_file)
+        if self.config is None:  # Bases are loaded by the parent, see add_base
+            try:
+                self.config, (_, self.config_mtime, _) = load_toml(config)
+            except FileNotFoundError as e:
+                raise FileNotFoundError(f"Config file does not exist: {config_file}") from e
 
         self.name = self.config.get("name", config.stem)
-        self.logger = self.logger.parent.getChild(self.name) if self.logger.parent else self.logger.getChild(self.name)
-        self.logger.debug(f"[{config_file}] Loaded config: {self.config}")
+        if self.logger.name.rpartition(".")[2] != self.name:  # Only get the named logger if it isn't already in use
+            self.logger = (self.logger.parent or self.logger).getChild(self.name)
+        self.logger.debug("[%s] Loaded config: %s", config_file, self.config)
 
         if getattr(self, "parent"):  # Inherit the parent and restrict top-level only attributes
-            for restricted in CHILD_RESTRICTED:
-                if restricted in self.config:
-                    raise ValueError(f"Cannot set {restricted} in a child config")
+            if restricted := CHILD_RESTRICTED & self.config.keys():
+                raise ValueError(f"Cannot set {', '.join(sorted(restricted))} in a child config")
             self.inherit_parent()
         elif "seed" not in self.config and "seed" not in DEFAULT_CONFIG:
             raise ValueError("Seed must be set in the top level config")
@@ -472,20 +626,21 @@ class GenTreeConfig:
             self.inherit_defaults()
 
         self.load_standard_config()
-        for key, value in self.config.items():
-            if key in ["name", "logger", "env", "crossdev_env", "bases", "whiteouts", "opaques", *DEF_ARGS]:
-                continue  # Don't set these attributes directly
-            self.logger.debug("[%s] Setting attribute from config: %s", key, value)
+        # Don't set skipped attributes directly
+        if config_attrs := {key: value for key, value in self.config.items() if key not in LOAD_CONFIG_SKIPPED}:
+            self.logger.debug("Setting attributes from config: %s", config_attrs)
+        for key, value in config_attrs.items():
             setattr(self, key, value)
 
         add_bases = self.bases or []
         add_bases.extend(self.config.get("bases", []))
         self.bases = []
-        self.add_base(add_bases)
+        self.add_bases(add_bases)
 
         self.whiteouts = self.config.get("whiteouts", set())
         self.opaques = self.config.get("opaques", set())
-        self.logger.log(5, "[%s] Processed config:\n%s", self.name, self)
+        if self.logger.isEnabledFor(5):
+            self.logger.log(5, "[%s] Processed config:\n%s", self.name, self.describe())
 
     def inherit_defaults(self):
         """Load inherited defaults for the top level config"""
@@ -499,10 +654,10 @@ class GenTreeConfig:
         Uses the main env dict, or crossdev_env if a crossdev target is set
         If a crossdev target is set, and crossdev_use_env is False, don't use the standard value
         """
-        val = self.config.get("env", {}).get(attr)
+        val = self.config.get("env", EMPTY).get(attr)
         def_val = self.get_default("env", attr, default=default)
         if self.crossdev_target:
-            if not self.crossdev_use_env and attr in [*ENV_VAR_INHERITED, "common_flags"]:
+            if not self.crossdev_use_env and attr in CROSSDEV_ENV_VARS:
                 def_val = self.get_default("crossdev_env", attr, default=default)
             else:  # Allow using the standard env if crossdev_use_env is set
                 def_val = self.get_default("crossdev_env", attr, default=def_val)
@@ -538,93 +693,148 @@ class GenTreeConfig:
                 self.env[env] = env_value
         self.inherit_parent_env()
 
-        use = PortageFlags(self.get_env("use", default=""))
+        # Build flag sets once, from the config flags chained with the inherited parent flags
+        use = flag_tokens(self.get_env("use", default=""))
         if (parent := self.parent) and self.inherit_use:
-            use |= parent.env["use"]
-        self.env["use"] = use
+            use = chain(use, parent.env["use"])
+        self.env["use"] = PortageFlags(use)
 
-        features = PortageFlags(self.get_env("features", default=""))
+        features = flag_tokens(self.get_env("features", default=""))
         if (parent := self.parent) and self.inherit_features:
-            features |= parent.env["features"]
-
-        self.env["features"] = features
+            features = chain(features, parent.env["features"])
+        self.env["features"] = PortageFlags(features)
 
         # Process common flags, pop common_flags from the env dict, apply to each type
         if common_flags := self.get_env("common_flags"):
+            common_tokens = flag_tokens(common_flags)
             for flag in COMMON_FLAGS:
                 if flag not in self.env:
                     self.env[flag] = common_flags
-                elif common_flags not in self.env[flag]:
-                    self.env[flag] += " " + common_flags
+                    continue
+                current_tokens = set(flag_tokens(self.env[flag]))
+                if missing := [token for token in common_tokens if token not in current_tokens]:
+                    self.env[flag] = " ".join([self.env[flag], *missing])  # Append only missing flags
                 else:
                     self.logger.debug("Common flag already set: %s=%s", flag, self.env[flag])
 
-    @handle_plural
     def check_dir(self, dirname, create=True):
         """Checks if a directory exists,
         if create is True, creates it if it doesn't exist
         otherwise raises FileNotFoundError"""
         if dirname := getattr(self, dirname):
-            path = Path(dirname).expanduser().resolve()
-            if not path.exists():
-                if create:
-                    self.logger.debug("Creating directory: %s", path)
-                    path.mkdir(parents=True)
-                else:
+            path = as_path(dirname).expanduser()  # mkdir follows symlinks, resolving would only add syscalls
+            if not create:
+                if not path.exists():
                     raise FileNotFoundError(f"Directory does not exist: {path}")
+                return
+
+            try:
+                path.mkdir(parents=True)
+            except FileExistsError:
+                return
+            self.logger.debug("Created directory: %s", path)
+
+    def check_dirs(self, dirnames, create=True):
+        """Checks multiple directories using check_dir"""
+        for dirname in dirnames:
+            self.check_dir(dirname, create=create)
+
+    @cached_property
+    def portage_profile(self):
+        """The portage profile to use, crossdev targets use the crossdev_profile if it is set"""
+        if self.crossdev_target:
+            return self.crossdev_profile or self.profile
+        return self.profile
+
+    @cached_property
+    def profile_link(self):
+        """The (symlink, target) used to set the portage profile, None if no profile is set.
+        Unless a config overlay is used, the symlink is shared by everything built in the seed."""
+        if not (profile := self.portage_profile):
+            return None
+        if self.crossdev_target:
+            profile_sym = Path(f"/usr/{self.crossdev_target}/etc/portage/make.profile")
+        else:
+            portage_config = self.portage_config_overlay if self.config_overlay else Path("/etc/portage")
+            profile_sym = portage_config / "make.profile"
+        return profile_sym, Path(f"/var/db/repos/{self.profile_repo}/profiles/{profile}")
 
     def set_portage_profile(self):
         """Sets the portage profile in the sysroot"""
-        if not self.profile and not self.crossdev_profile:
+        if not self.profile_link:
             return self.logger.debug("No portage profile set")
 
-        profile, profile_repo = self.profile, self.profile_repo
-        portage_config = self.portage_config_overlay if self.config_overlay else Path("/etc/portage")
-        profile_sym = portage_config / "make.profile"
-        if self.crossdev_target:
-            profile = self.crossdev_profile or self.profile
-            profile_sym = Path(f"/usr/{self.crossdev_target}/etc/portage/make.profile")
-
-        profile_target = Path(f"/var/db/repos/{profile_repo}/profiles/{profile}")
-        if profile_sym.is_symlink() and profile_sym.resolve() == profile_target:
-            return self.logger.debug("Portage profile already set: %s -> %s", profile_sym, profile_target)
+        profile_sym, profile_target = self.profile_link
+        try:  # Compare the link itself, relative links are normalized against the link dir rather than resolved
+            if Path(normpath(profile_sym.parent / profile_sym.readlink())) == profile_target:
+                return self.logger.debug("Portage profile already set: %s -> %s", profile_sym, profile_target)
+        except OSError:  # Missing, or not a symlink
+            pass
 
         self.logger.info(
             " ~-~ [%s] Setting portage profile: %s",
-            colorize(profile_repo, "yellow"),
-            colorize(profile, "blue"),
+            colorize(self.profile_repo, "yellow"),
+            colorize(self.portage_profile, "blue"),
         )
 
-        if profile_sym.exists(follow_symlinks=False):
-            profile_sym.unlink()
+        profile_sym.unlink(missing_ok=True)
 
         if not profile_target.exists():
             self.logger.info(" -+- %s", self.emerge_profiles)
             raise FileNotFoundError(f"Portage profile not found: {profile_target}")
 
         profile_sym.symlink_to(profile_target, target_is_directory=True)
-        self.logger.debug("Set portage profile symlink: %s -> %s", profile_sym, profile_sym.resolve())
+        self.logger.debug("Set portage profile symlink: %s -> %s", profile_sym, profile_target)
 
     def set_portage_env(self):
         """Sets portage environment variables based on the config"""
-        for name, value in self.env.items():
+        env, env_updates = self.env, {}
+        for name, value in env.items():
             name = name.upper()
-            if value is None or hasattr(value, "__len__") and len(value) == 0:
-                if name in environ:
-                    self.logger.debug("Unsetting environment variable: %s", name)
-                    environ.pop(name)
+            if value is None or not value and hasattr(value, "__len__"):  # Unset empty values, keep 0 and False
+                if environ.pop(name, None) is not None:
+                    self.logger.debug("Unset environment variable: %s", name)
                 continue
+            if environ.get(name) == (value := str(value)):
+                continue  # Skip the putenv call for unchanged values
             self.logger.debug("Setting environment variable: %s=%s", name, value)
-            environ[name] = str(value)
+            env_updates[name] = value
+        environ.update(env_updates)
 
-        if accept_keywords := self.env.get("accept_keywords"):
+        if accept_keywords := env.get("accept_keywords"):
             self.logger.info(" ~*~ Accepting keywords: %s", colorize(accept_keywords, "yellow"))
 
-        if use := self.env.get("use"):
+        if use := env.get("use"):
             self.logger.info(" ~+~ Environment USE flags: %s", colorize(use, "yellow"))
 
+    def __setattr__(self, attr, value):
+        """Clears cached properties when a config field is set, as they are derived from config fields"""
+        super().__setattr__(attr, value)
+        if attr in self.__dataclass_fields__:
+            self.clear_cached_properties()
+
+    def clear_cached_properties(self):
+        """Clears all computed cached properties"""
+        for cached in CACHED_PROPERTIES & self.__dict__.keys():
+            del self.__dict__[cached]
+
+    def describe(self):
+        """Returns set config values, excluding the parent and bases, pretty printed.
+        Values are read directly, so unset values are not loaded from the defaults."""
+        get_value = super().__getattribute__
+        values = ((attr, get_value(attr)) for attr in self.__dataclass_fields__ if attr not in ("parent", "bases"))
+        return pretty_print({attr: value for attr, value in values if value is not None})
+
     def __str__(self):
-        out_dict = {attr: getattr(self, attr) for attr in self.__dataclass_fields__}
-        out_dict.pop("parent", None)
-        out_dict.pop("bases", None)
-        return pretty_print(out_dict)
+        return f"{self.__class__.__name__}(name={self.name!r}, config_file={self.config_file!r})"
+
+
+# Public config fields which may be loaded from the defaults when unset
+DEFAULT_LOOKUP_FIELDS = frozenset(
+    name for name in GenTreeConfig.__dataclass_fields__ if not name.startswith("_") and name not in NO_DEFAULT_LOOKUP
+)
+
+# Names of all cached properties, cleared when a config field is set
+CACHED_PROPERTIES = frozenset(
+    name for cls in GenTreeConfig.__mro__ for name, attr in vars(cls).items() if isinstance(attr, cached_property)
+)
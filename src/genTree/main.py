@@ -10,6 +10,7 @@ from zenlib.util import get_kwargs
 from . import COMMON_ARGS
 from .filters import GenTreeTarFilter
 from .genTree import GenTree
+from .reflink import reflink_copy
 
 
 def main():
@@ -194,7 +195,7 @@ def import_seed():
 
     if seed.is_dir() and seed.exists():
         logger.info(f"Copying seed directory: {seed} -> {seed_dir}")
-        copytree(seed, seed_dir)
+        copytree(seed, seed_dir, copy_function=reflink_copy)
     else:
         with TarFile.open(seed) as tar:
             logger.info(f"Extracting seed archive: {seed} -> {seed_dir}")
@@ -1,5 +1,5 @@
 from .mount_mixins import MountMixins
 from .oci_mixins import OCIMixins
-from .portage_types import EmergeBools, PortageFlags
+from .portage_types import PORTAGE_PLAIN_BOOLS, EmergeBools, PortageFlags, flag_tokens
 
-__all__ = ["MountMixins", "OCIMixins", "EmergeBools", "PortageFlags"]
+__all__ = ["MountMixins", "OCIMixins", "EmergeBools", "PortageFlags", "flag_tokens", "PORTAGE_PLAIN_BOOLS"]
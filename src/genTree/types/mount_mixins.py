@@ -1,14 +1,37 @@
+from functools import cached_property
 from pathlib import Path
 from shutil import copytree, rmtree
 from subprocess import CalledProcessError, run
 
 from zenlib.util import colorize
 
+from ..reflink import reflink_copy
+
 
 class MountMixins:
+    @cached_property
+    def mounts(self):
+        """Known mount states by path, updated by the mount helpers so mountpoints aren't checked again"""
+        return {}
+
+    def is_mount(self, path) -> bool:
+        """Checks if a path is a mountpoint, using the cached state if it is known"""
+        path = str(path)
+        if (mounted := self.mounts.get(path)) is None:
+            mounted = self.mounts[path] = Path(path).is_mount()
+        return mounted
+
+    def set_mounted(self, path, mounted=True):
+        """Sets the cached mount state of a path. When unmounting, cached states under the path are dropped."""
+        path = str(path)
+        if not mounted:
+            for submount in [p for p in self.mounts if p.startswith(f"{path}/")]:
+                del self.mounts[submount]
+        self.mounts[path] = mounted
+
     def mount_config_overlay(self, config):
         """Mounts a config overlay over /etc/portage"""
-        if Path("/etc/portage").is_mount():
+        if self.is_mount("/etc/portage"):
             config.logger.info(" -v- Unmounting config overlay on /etc/portage")
             try:
                 run(["umount", "/etc/portage"], check=True, capture_output=True)
@@ -17,6 +40,7 @@ class MountMixins:
                     config.logger.warning("Unable to update userspace mount table unmounting /etc/portage.")
                 else:
                     raise e
+            self.set_mounted("/etc/portage", False)
         if not config.config_overlay:
             return config.logger.debug("No config overlay specified, skipping config overlay mount")
 
@@ -31,7 +55,9 @@ class MountMixins:
         # Mount an overlay using /etc/portage as the lower dir, and the overlay portage config as the mountpoint
         self.overlay_mount(config.portage_config_overlay, "/etc/portage", temp=True, log=False)
         # Copy all files from the config dir to the overlay portage config dir
-        copytree(config.portage_config_dir, config.portage_config_overlay, dirs_exist_ok=True)
+        copytree(
+            config.portage_config_dir, config.portage_config_overlay, dirs_exist_ok=True, copy_function=reflink_copy
+        )
 
 
     def mount_seed_overlay(self):
@@ -67,9 +93,8 @@ class MountMixins:
         If size is 0, the size is unlimited.
         """
         mountpoint = Path(mountpoint)
-        if not mountpoint.exists():
-            self.logger.debug("[tmpfs] Creating mountpoint: %s", mountpoint)
-            mountpoint.mkdir(parents=True)
+        self.logger.debug("[tmpfs] Creating mountpoint: %s", mountpoint)
+        mountpoint.mkdir(parents=True, exist_ok=True)  # May be created by another base worker
 
         args = ["mount", "-t", "tmpfs", "tmpfs", mountpoint]
         if size:
@@ -79,6 +104,7 @@ class MountMixins:
 
         self.logger.info(" +/~ Mounting tmpfs on: %s", colorize(mountpoint, "yellow"))
         run(args, check=True)
+        self.set_mounted(mountpoint)
 
     def overlay_mount(
         self,
@@ -103,10 +129,11 @@ class MountMixins:
             raise FileNotFoundError(f"Lower directory not found: {lowerdir}")
         if not mountpoint.exists():
             self.logger.debug("[overlay] Creating mountpoint: %s", mountpoint)
-            mountpoint.mkdir(parents=True)
-        elif mountpoint.is_mount():
+            mountpoint.mkdir(parents=True, exist_ok=True)  # May be created by another base worker
+        elif self.is_mount(mountpoint):
             self.logger.info(" - - Unmounting overlay on: %s", mountpoint)
             run(["umount", mountpoint], check=True)
+            self.set_mounted(mountpoint, False)
 
         if temp:
             tmpdir = lowerdir.with_name(f".{lowerdir.name}_temp")
@@ -125,10 +152,10 @@ class MountMixins:
 
         if not upper.exists():
             self.logger.debug("[overlay] Creating upper directory: %s", upper)
-            upper.mkdir(parents=True)
+            upper.mkdir(parents=True, exist_ok=True)
         if not work.exists():
             self.logger.debug("[overlay] Creating work directory: %s", work)
-            work.mkdir(parents=True)
+            work.mkdir(parents=True, exist_ok=True)
 
         options = "userxattr," if userxattr else ""
         options += f"lowerdir={lowerdir},upperdir={upper},workdir={work}"
@@ -137,6 +164,7 @@ class MountMixins:
         loglevel = 20 if log else 10
         self.logger.log(loglevel, " ~/* Mounting overlay on: %s", colorize(mountpoint, "cyan", bold=True))
         run(args, check=True)
+        self.set_mounted(mountpoint)
 
     def bind_mount(self, source: Path, dest: Path, recursive=False, readonly=True, file=False):
         """Bind mounts a source directory over a destination directory"""
@@ -152,9 +180,10 @@ class MountMixins:
 
         s2 = ">" if readonly else "-"
 
-        if dest.is_mount():
+        if self.is_mount(dest):
             self.logger.info(" - - Unmounting %s: %s", colorize(source, "red"), colorize(dest, "magenta"))
             run(["umount", dest], check=True)
+            self.set_mounted(dest, False)
 
         if not source.exists():
             if file:
@@ -180,6 +209,7 @@ class MountMixins:
             " %s%s%s Mounting %s over: %s", s1, s2, s1, colorize(source, "green"), colorize(dest, "magenta", bold=True)
         )
         run(args, check=True)
+        self.set_mounted(dest)
 
     def mount_system_dirs(self):
         """Mounts /proc, /sys, and /dev in the build root"""
@@ -190,3 +220,4 @@ class MountMixins:
         self.bind_mount("/dev", config.sysroot / "dev", recursive=True)
         self.bind_mount("/run", config.sysroot / "run", recursive=True)
         run(["mount", "--types", "devpts", "devpts", config.sysroot / "dev/pts"], check=True)
+        self.set_mounted(config.sysroot / "dev/pts")
@@ -1,4 +1,28 @@
 from collections import UserDict
+from functools import lru_cache
+
+# Some bools don't support y/n, just --bool
+PORTAGE_PLAIN_BOOLS = frozenset(["nodeps", "oneshot"])
+
+
+@lru_cache(maxsize=256)
+def split_flags(flags: str) -> tuple[str, ...]:
+    """Splits a flag string by whitespace, cached as the same strings are loaded for many configs"""
+    return tuple(flags.split())
+
+
+def flag_tokens(flags):
+    """Returns the individual flags of a flag string, or flag iterables as is"""
+    return split_flags(flags) if isinstance(flags, str) else flags
+
+
+@lru_cache(maxsize=None)
+def bool_option(key: str) -> tuple[str, bool]:
+    """Returns the emerge option name for a bool flag, and if it is a plain bool without a y/n value.
+    Cached, the same flags are formatted for every config"""
+    if key in PORTAGE_PLAIN_BOOLS:
+        return f"--{key}", True
+    return f"--{key.replace('_', '-')}", False
 
 
 class FlagBool:
@@ -28,27 +52,24 @@ class EmergeBools(UserDict):
         super().__setitem__(key, FlagBool(value))
 
     def __getitem__(self, key):
-        from genTree import PORTAGE_PLAIN_BOOLS
-
-        if key in PORTAGE_PLAIN_BOOLS:
-            if super().__getitem__(key):
-                return f"--{key}"
-            return
+        option, plain = bool_option(key)
+        value = super().__getitem__(key)
+        if plain:
+            return option if value else None
+        return f"{option}={value}"
 
-        bool_str = f"--{key.replace('_', '-')}={super().__getitem__(key)}"
-        return bool_str
+    def as_list(self):
+        """Returns the emerge args for set flags, plain bools which are unset are skipped"""
+        return [value for value in self.values() if value]
 
     def __str__(self):
-        return " ".join((value for value in self.values() if value))
+        return " ".join(self.as_list())
 
 
 class PortageFlags(set):
     def __init__(self, flags):
         """Splits the flags by whitespace and adds them to the set"""
-        if isinstance(flags, str):
-            super().__init__(flags.split())
-        else:
-            super().__init__(flags)
+        super().__init__(flag_tokens(flags))
 
     def add(self, item):
         """If it starts with +, remove that prefix and add the item.